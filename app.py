@@ -2,6 +2,19 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import html
+import json
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from bisect import bisect_left
+from contextlib import closing
+from functools import partial
+from pathlib import Path
+
+import streamlit.components.v1 as components
 
 # Altair is commonly available via Streamlit installs; if not, we gracefully fall back.
 try:
@@ -11,6 +24,9 @@ except Exception:
     alt = None
     HAS_ALTAIR = False
 
+# st.fragment graduated from st.experimental_fragment in 1.37; fall back to a plain call if neither exists.
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
 
 # ==========================================
 # 1) CONFIGURATION & STYLING
@@ -311,8 +327,8 @@ div[data-testid="stExpander"]{
 # 2) DATA LOGIC
 # ==========================================
 @st.cache_data(show_spinner=False)
-def load_data(file) -> pd.DataFrame:
-    """Loads and cleans the messy Excel/CSV data."""
+def load_data(file, supplier_aliases: dict | None = None) -> pd.DataFrame:
+    """Loads and cleans the messy Excel/CSV data. `supplier_aliases` ({column: {alias: canonical}}) is applied last."""
     if file.name.endswith(".csv"):
         df = pd.read_csv(file, on_bad_lines="skip")
     else:
@@ -333,17 +349,915 @@ def load_data(file) -> pd.DataFrame:
 
     df.columns = clean_cols
     df = df.fillna("")
+
+    for col, mapping in (supplier_aliases or {}).items():
+        if mapping and col in df.columns:
+            df[col] = df[col].astype(str).str.strip().map(mapping).fillna(df[col])
     return df
 
 
 @st.cache_data(show_spinner=False)
-def aggregate_data(df: pd.DataFrame, group_col: str, pivot_col: str, features: list[str]) -> pd.DataFrame:
-    grouped = df.groupby([group_col, pivot_col])[features].agg(
-        lambda x: ", ".join(sorted(set([str(v) for v in x if v != ""])))
-    ).reset_index()
-    return grouped
+def aggregate_data(df: pd.DataFrame, group_col: str, pivot_col: str, features: list[str]) -> tuple[pd.DataFrame, dict]:
+    """
+    Distinct non-empty values per (group, pivot) and feature, sorted and ", "-joined.
+    The same pass builds the provenance index {(group, pivot, feature): {value: source row labels}},
+    so a cell's source rows are a dict lookup instead of a rescan of `df`.
+    """
+    keys = [group_col, pivot_col]
+    long = df[keys + features].melt(id_vars=keys, var_name="feature", value_name="value", ignore_index=False)
+    long = long[long["value"] != ""]
+    long["value"] = long["value"].astype(str)
+    codes, values = pd.factorize(long["value"], sort=True)  # code order == string order
+    long["code"] = codes
+
+    cells = long.drop_duplicates(keys + ["feature", "code"]).sort_values(keys + ["feature", "code"])
+    grouped = df[keys].drop_duplicates().sort_values(keys).reset_index(drop=True)
+    if not cells.empty:
+        wide = cells.groupby(keys + ["feature"], sort=False)["value"].agg(", ".join).unstack("feature")
+        grouped = grouped.merge(wide.reset_index(), on=keys, how="left")
+    grouped = grouped.reindex(columns=keys + features).fillna("")
+
+    rows = long.index.to_numpy()
+    provenance = {}
+    for (g, p, f, code), idx in long.groupby(keys + ["feature", "code"], sort=False).indices.items():
+        provenance.setdefault((str(g), str(p).strip(), f), {})[values[code]] = rows[idx]
+    return grouped, provenance
+
+
+def provenance_values(provenance: dict, group: str, supplier: str, feature: str) -> dict[str, int]:
+    """{value: source-row count} for one (family, supplier, feature) cell."""
+    cell = provenance.get((group, supplier, feature), {})
+    return {v: len(cell[v]) for v in sorted(cell)}
+
+
+def provenance_rows(
+    provenance: dict, df: pd.DataFrame, group: str, supplier: str, feature: str, value: str, offset: int, limit: int
+) -> pd.DataFrame:
+    """One page of a cell value's source rows, indexed by their position in the upload."""
+    rows = provenance.get((group, supplier, feature), {}).get(value, np.empty(0, dtype=np.int64))
+    return df.loc[rows[offset:offset + limit]]
+
+
+def family_kpis(subset: pd.DataFrame, supplier_col: str) -> dict:
+    """KPI numbers + per-supplier record counts for one family (in-memory backend)."""
+    if not subset.empty and subset[supplier_col].astype(str).ne("").any():
+        try:
+            top_supplier = subset[supplier_col].mode()[0]
+        except Exception:
+            top_supplier = "N/A"
+    else:
+        top_supplier = "N/A"
+
+    return {
+        "num_suppliers": int(subset[supplier_col].nunique()),
+        "total_records": int(len(subset)),
+        "top_supplier": top_supplier,
+        "supplier_records": subset.groupby(supplier_col).size().to_dict(),
+    }
+
+
+def kpis_from_records(supplier_records: dict) -> dict:
+    """family_kpis computed from per-supplier record counts alone (counts are additive, so they roll up)."""
+    ranked = sorted(supplier_records.items(), key=lambda kv: (-kv[1], str(kv[0])))
+    has_supplier = any(str(sup) != "" for sup in supplier_records)
+    return {
+        "num_suppliers": len(supplier_records),
+        "total_records": int(sum(supplier_records.values())),
+        "top_supplier": ranked[0][0] if has_supplier else "N/A",
+        "supplier_records": supplier_records,
+    }
+
+
+def build_family_state(agg_df: pd.DataFrame, supplier_col: str, features: list[str], supplier_records: dict) -> dict:
+    """
+    Family-level state shared by Compare + Catalog: supplier list, per-supplier feature map and coverage summary.
+    Computed once per full run and handed to the view fragments, which never recompute it.
+    """
+    suppliers_all = sorted([s for s in agg_df[supplier_col].astype(str).unique().tolist() if str(s).strip() != ""])
+
+    # Per-supplier feature values (already aggregated)
+    values = agg_df[features].astype(str).apply(lambda col: col.str.strip())
+    sup_keys = agg_df[supplier_col].astype(str).str.strip()
+    supplier_feature_map = {}
+    for sup, row in zip(sup_keys, values.to_dict("records")):
+        if sup == "":
+            continue
+        supplier_feature_map.setdefault(sup, {}).update(row)
+
+    # Coverage summary per supplier
+    total = len(features)
+    supplier_summary = {}
+    for sup in suppliers_all:
+        filled = sum(1 for f in features if supplier_feature_map.get(sup, {}).get(f, "") != "")
+        coverage_pct = (filled / total * 100.0) if total else 0.0
+        supplier_summary[sup] = {
+            "filled": filled,
+            "total": total,
+            "coverage_pct": coverage_pct,
+            "records": int(supplier_records.get(sup, 0)),
+        }
+
+    return {
+        "suppliers_all": suppliers_all,
+        "supplier_feature_map": supplier_feature_map,
+        "supplier_summary": supplier_summary,
+    }
+
+
+
+# ------------------------------------------
+# Optional SQLite backend
+# ------------------------------------------
+# load_data's output is written once to a local SQLite file keyed by the upload's content hash, so a restart
+# (or a re-upload of the same file) never re-parses it. Columns are stored as c0..cN (safe identifiers, all TEXT, like the
+# str() view aggregate_data uses) with the original names in a side table; family filters, KPIs and the
+# distinct-value aggregation then run as indexed queries instead of pandas scans over the full frame.
+STORE_DIR = Path(__file__).with_name(".dataset_store")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+def dataset_digest(file, supplier_aliases: dict | None = None) -> str:
+    """Hash of an upload + the alias map applied to it; identifies a dataset across reruns, sessions and restarts."""
+    h = hashlib.sha256(file.getvalue())
+    if supplier_aliases:
+        h.update(json.dumps(supplier_aliases, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def open_dataset_store(file, supplier_aliases: dict | None = None) -> str:
+    """Returns the SQLite path for this upload, ingesting load_data's output the first time it is seen."""
+    path = STORE_DIR / f"{dataset_digest(file, supplier_aliases)}.sqlite"
+    if path.exists():
+        return str(path)
+
+    STORE_DIR.mkdir(exist_ok=True)
+    df = load_data(file, supplier_aliases)
+    tmp = path.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+    with closing(_connect(str(tmp))) as con:
+        frame = df.astype(str)
+        frame.columns = [f"c{i}" for i in range(frame.shape[1])]
+        frame.to_sql("data", con, index=False, chunksize=50_000)
+        pd.DataFrame({"pos": range(len(df.columns)), "name": list(df.columns)}).to_sql("columns", con, index=False)
+        con.commit()
+    tmp.replace(path)  # atomic: a half-written store is never picked up
+    return str(path)
+
+
+@st.cache_data(show_spinner=False)
+def store_columns(path: str) -> list[str]:
+    with closing(_connect(path)) as con:
+        return [r[0] for r in con.execute("SELECT name FROM columns ORDER BY pos")]
+
+
+def _store_col(path: str, name: str) -> str:
+    return f"c{store_columns(path).index(name)}"
+
+
+def ensure_store_indexes(path: str, group_col: str, supplier_col: str) -> None:
+    """(group, supplier) serves the family filter + per-supplier grouping; supplier alone serves supplier lookups."""
+    g, s = _store_col(path, group_col), _store_col(path, supplier_col)
+    with closing(_connect(path)) as con:
+        con.execute(f"CREATE INDEX IF NOT EXISTS ix_{g}_{s} ON data({g}, {s})")
+        con.execute(f"CREATE INDEX IF NOT EXISTS ix_{s} ON data({s})")
+        con.commit()
+
+
+@st.cache_data(show_spinner=False)
+def store_shape(path: str) -> tuple[int, int]:
+    with closing(_connect(path)) as con:
+        n = con.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+    return int(n), len(store_columns(path))
+
+
+def store_frame(path: str, where: str = "", params: tuple = (), limit: int | None = None) -> pd.DataFrame:
+    """Reads rows back as a load_data-shaped frame (original column names, original row order)."""
+    sql = "SELECT * FROM data" + (f" WHERE {where}" if where else "") + " ORDER BY rowid"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    with closing(_connect(path)) as con:
+        frame = pd.read_sql_query(sql, con, params=params)
+    frame.columns = store_columns(path)
+    return frame
+
+
+@st.cache_data(show_spinner=False)
+def store_groups(path: str, group_col: str) -> list[str]:
+    g = _store_col(path, group_col)
+    with closing(_connect(path)) as con:
+        return [r[0] for r in con.execute(f"SELECT DISTINCT {g} FROM data ORDER BY {g}")]
+
+
+@st.cache_data(show_spinner=False)
+def store_value_counts(path: str, col: str) -> pd.Series:
+    c = _store_col(path, col)
+    with closing(_connect(path)) as con:
+        rows = con.execute(f"SELECT TRIM({c}), COUNT(*) FROM data GROUP BY TRIM({c})").fetchall()
+    return pd.Series({v: int(n) for v, n in rows}, dtype="int64")
+
+
+@st.cache_data(show_spinner=False)
+def store_family_kpis(path: str, group_col: str, supplier_col: str, group: str) -> dict:
+    """Same numbers as family_kpis, computed by one indexed GROUP BY over the family's rows."""
+    g, s = _store_col(path, group_col), _store_col(path, supplier_col)
+    with closing(_connect(path)) as con:
+        counts = con.execute(
+            f"SELECT {s}, COUNT(*) AS n FROM data WHERE {g} = ? GROUP BY {s} ORDER BY n DESC, {s}", (group,)
+        ).fetchall()
+
+    return kpis_from_records({sup: int(n) for sup, n in counts})
+
+
+@st.cache_data(show_spinner=False)
+def store_aggregate(path: str, group_col: str, supplier_col: str, features: list[str], group: str) -> pd.DataFrame:
+    """
+    aggregate_data for one family, pushed down to SQLite: per feature, the index narrows to the family and
+    SELECT DISTINCT dedupes values; rows are streamed from the cursor and only joined here.
+    """
+    g, s = _store_col(path, group_col), _store_col(path, supplier_col)
+    with closing(_connect(path)) as con:
+        suppliers = [r[0] for r in con.execute(f"SELECT DISTINCT {s} FROM data WHERE {g} = ? ORDER BY {s}", (group,))]
+        out = {f: dict.fromkeys(suppliers, "") for f in features}
+        for f in features:
+            c = _store_col(path, f)
+            cur = con.execute(
+                f"SELECT DISTINCT {s}, {c} FROM data WHERE {g} = ? AND {c} <> '' ORDER BY {s}, {c}", (group,)
+            )
+            vals = {}
+            for sup, v in cur:
+                vals.setdefault(sup, []).append(v)
+            out[f].update({sup: ", ".join(vs) for sup, vs in vals.items()})
+
+    agg = pd.DataFrame({group_col: group, supplier_col: suppliers})
+    for f in features:
+        agg[f] = [out[f][sup] for sup in suppliers]
+    return agg
+
+
+def _store_scope(path: str, scope: tuple) -> tuple[str, tuple]:
+    """WHERE clause + params for a ((column, value), ...) family scope; the leading column hits the index."""
+    return " AND ".join(f"{_store_col(path, c)} = ?" for c, _ in scope), tuple(v for _, v in scope)
+
+
+@st.cache_data(show_spinner=False)
+def store_cell_values(path: str, supplier_col: str, scope: tuple, supplier: str, feature: str) -> dict[str, int]:
+    """provenance_values for the store: {value: source-row count} of one cell, by one indexed GROUP BY."""
+    s, c = _store_col(path, supplier_col), _store_col(path, feature)
+    where, params = _store_scope(path, scope)
+    with closing(_connect(path)) as con:
+        rows = con.execute(
+            f"SELECT {c}, COUNT(*) FROM data WHERE {where} AND TRIM({s}) = ? AND {c} <> '' GROUP BY {c} ORDER BY {c}",
+            params + (supplier,),
+        ).fetchall()
+    return {v: int(n) for v, n in rows}
+
+
+def store_cell_rows(
+    path: str, supplier_col: str, scope: tuple, supplier: str, feature: str, value: str, offset: int, limit: int
+) -> pd.DataFrame:
+    """provenance_rows for the store: one page of source rows, indexed by rowid - 1 (= position in the upload)."""
+    s, c = _store_col(path, supplier_col), _store_col(path, feature)
+    where, params = _store_scope(path, scope)
+    sql = (
+        f"SELECT rowid - 1 AS _pos, * FROM data WHERE {where} AND TRIM({s}) = ? AND {c} = ? "
+        f"ORDER BY rowid LIMIT {int(limit)} OFFSET {int(offset)}"
+    )
+    with closing(_connect(path)) as con:
+        frame = pd.read_sql_query(sql, con, params=params + (supplier, value), index_col="_pos")
+    frame.columns = store_columns(path)
+    frame.index.name = None
+    return frame
+
+
+# ------------------------------------------
+# Persistent aggregate store
+# ------------------------------------------
+# Exact per-family results (aggregate_data output, KPI stats, supplier map + summary) are pickled under
+# AGGREGATE_CACHE_DIR/<config key>/<family key>.pkl. The config key hashes the dataset digest, the column
+# mapping and AGGREGATE_ENGINE_VERSION, so any input change lands in a fresh directory and stale entries are
+# never read; old directories are pruned least-recently-used first.
+AGGREGATE_CACHE_DIR = Path(__file__).with_name(".aggregate_cache")
+AGGREGATE_ENGINE_VERSION = 1  # bump whenever aggregate_data / family_kpis output changes
+AGGREGATE_CACHE_KEEP = 20
+
+
+def aggregate_store_key(dataset_key: str, group_col: str, supplier_col: str, features: list[str]) -> str:
+    config = {
+        "engine": AGGREGATE_ENGINE_VERSION,
+        "dataset": dataset_key,
+        "group": group_col,
+        "supplier": supplier_col,
+        "features": list(features),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def _aggregate_entry_path(config_key: str, family: str) -> Path:
+    return AGGREGATE_CACHE_DIR / config_key / f"{hashlib.sha256(str(family).encode('utf-8')).hexdigest()[:24]}.pkl"
+
+
+def load_family_aggregate(config_key: str, family: str) -> tuple[pd.DataFrame, dict, dict] | None:
+    """Returns (agg_df, kpis, family_state) from disk, or None when this family has not been computed for this config."""
+    path = _aggregate_entry_path(config_key, family)
+    if not path.exists():
+        return None
+    try:
+        entry = pd.read_pickle(path)
+    except Exception:
+        return None  # truncated or unreadable entry: recompute and overwrite
+    if entry.get("engine") != AGGREGATE_ENGINE_VERSION or entry.get("family") != family:
+        return None
+    os.utime(path.parent)  # LRU bookkeeping for pruning
+    return entry["agg"], entry["kpis"], entry["state"]
+
+
+def save_family_aggregate(config_key: str, family: str, agg_df: pd.DataFrame, kpis: dict, family_state: dict) -> None:
+    path = _aggregate_entry_path(config_key, family)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    entry = {"engine": AGGREGATE_ENGINE_VERSION, "family": family, "agg": agg_df, "kpis": kpis, "state": family_state}
+    pd.to_pickle(entry, tmp)
+    tmp.replace(path)  # atomic: readers never see a half-written entry
+
+    configs = sorted(AGGREGATE_CACHE_DIR.iterdir(), key=lambda d: d.stat().st_mtime, reverse=True)
+    for stale in configs[AGGREGATE_CACHE_KEEP:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+# ------------------------------------------
+# Column profiling (Dataset overview)
+# ------------------------------------------
+@st.cache_data(show_spinner=False)
+def profile_dataset(dataset_key: str, group_col: str, _load, top_n: int = 3) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    One vectorized pass per column: fill rate, distinct count, top values and value-length distribution.
+    Also returns per-family fill rates (families × columns, 0–100). Cached per dataset_key (`_load` is not hashed).
+    """
+    df = _load()
+    text = df.astype(str)
+    filled = text.apply(lambda c: c.str.strip() != "")
+
+    rows = []
+    for col in text.columns:
+        vals = text.loc[filled[col], col]
+        counts = vals.value_counts()
+        lengths = vals.str.len()
+        rows.append({
+            "Column": col,
+            "Fill %": float(filled[col].mean() * 100) if len(df) else 0.0,
+            "Distinct": int(len(counts)),
+            "Top values": ", ".join(f"{_shorten(v, 40)} ({n})" for v, n in counts.head(top_n).items()),
+            "Len min": int(lengths.min()) if len(lengths) else 0,
+            "Len median": float(lengths.median()) if len(lengths) else 0.0,
+            "Len p95": float(lengths.quantile(0.95)) if len(lengths) else 0.0,
+            "Len max": int(lengths.max()) if len(lengths) else 0,
+        })
+
+    family_fill = (filled.groupby(text[group_col]).mean() * 100).round(1)
+    family_fill.index.name = group_col
+    return pd.DataFrame(rows), family_fill
+
+
+# ------------------------------------------
+# Hierarchical grouping (drill-down)
+# ------------------------------------------
+HIERARCHY_SEP = " › "
+
+
+@st.cache_resource(show_spinner=False)
+def build_hierarchy(dataset_key: str, levels: list[str], supplier_col: str, features: list[str], _load) -> dict:
+    """
+    Distinct-value sets per (node, supplier, feature) for every depth of `levels` (top → bottom).
+    Raw rows are scanned once for the leaf level; each parent level is the union of its children's sets,
+    i.e. a dedupe on value codes after dropping the last path column, so it never touches raw rows again.
+    Values are factorized with sort=True, so code order is string order and joined cells match aggregate_data.
+    Cached per dataset_key (the frame behind `_load` is not hashed) and shared read-only across sessions.
+    """
+    keys = levels + [supplier_col]
+    frame = _load()[keys + features].astype(str)
+    long = frame.melt(id_vars=keys, var_name="feature", value_name="value")
+    long = long[long["value"] != ""]
+    codes, values = pd.factorize(long["value"], sort=True)
+
+    cells = long[keys + ["feature"]].assign(code=codes).drop_duplicates(ignore_index=True)
+    counts = frame.groupby(keys, sort=False).size().rename("n").reset_index()
+
+    depths = {}
+    for d in range(len(levels), 0, -1):
+        if d < len(levels):
+            cells = cells.drop(columns=levels[d]).drop_duplicates(ignore_index=True)
+            counts = counts.drop(columns=levels[d]).groupby(levels[:d] + [supplier_col], sort=False, as_index=False)["n"].sum()
+        depths[d] = {
+            "cells": cells,
+            "counts": counts,
+            "cell_rows": _node_positions(cells, levels[:d]),
+            "count_rows": _node_positions(counts, levels[:d]),
+        }
+
+    return {"levels": list(levels), "values": values, "depths": depths}
+
+
+def _node_positions(frame: pd.DataFrame, path_cols: list[str]) -> dict:
+    """Node path tuple → row positions, so opening a node is a dict lookup instead of a mask over the level."""
+    return {
+        (k if isinstance(k, tuple) else (k,)): pos
+        for k, pos in frame.groupby(path_cols, sort=False).indices.items()
+    }
+
+
+def hierarchy_nodes(hierarchy: dict, depth: int) -> list[tuple]:
+    return sorted(hierarchy["depths"][depth]["count_rows"])
+
+
+def hierarchy_node_aggregate(
+    hierarchy: dict,
+    path: tuple,
+    group_col: str,
+    supplier_col: str,
+    features: list[str]
+) -> tuple[pd.DataFrame, dict]:
+    """aggregate_data-shaped frame + per-supplier record counts for one node, read from the precomputed rollup."""
+    level = hierarchy["depths"][len(path)]
+    counts = level["counts"].iloc[level["count_rows"].get(path, [])]
+    cells = level["cells"].iloc[level["cell_rows"].get(path, [])]
+
+    supplier_records = dict(zip(counts[supplier_col], counts["n"].astype(int)))
+    suppliers = sorted(supplier_records)
+
+    cells = cells.sort_values([supplier_col, "feature", "code"])
+    joined = (
+        cells.assign(value=hierarchy["values"].to_numpy()[cells["code"].to_numpy()])
+        .groupby([supplier_col, "feature"], sort=False)["value"]
+        .agg(", ".join)
+    )
+    wide = joined.unstack("feature") if not joined.empty else pd.DataFrame(index=pd.Index([], name=supplier_col))
+    wide = wide.reindex(index=suppliers, columns=features).fillna("")
+    wide.index.name = supplier_col
+    wide.columns.name = None
+
+    agg = wide.reset_index()
+    agg.insert(0, group_col, HIERARCHY_SEP.join(path))
+    return agg, supplier_records
+
+
+# ------------------------------------------
+# Approximate mode (mergeable sketches)
+# ------------------------------------------
+# For very large families, exact set building per (supplier, feature) is replaced by:
+#   • HyperLogLog registers per (supplier, feature), kept sparse as (key, register, rank) rows. Merging
+#     sketches (across suppliers, families, …) is a groupby-max, and state is bounded by registers, not values.
+#   • Top-k heavy hitters per (supplier, feature) from a uniform row sample of APPROX_SAMPLE_ROWS rows.
+HLL_P = 12
+HLL_M = 1 << HLL_P
+HLL_REL_ERROR = 1.04 / np.sqrt(HLL_M)  # ≈1.6% (1σ) on distinct counts
+APPROX_SAMPLE_ROWS = 100_000
+APPROX_TOP_K = 5
+
+
+def _bit_length32(v: np.ndarray) -> np.ndarray:
+    """Exact bit length for values < 2**32 (float64 represents them exactly)."""
+    return np.where(v > 0, np.frexp(v.astype(np.float64))[1], 0)
+
+
+def _hll_registers(keys: pd.DataFrame, hashes: np.ndarray) -> pd.DataFrame:
+    """Sparse HLL sketch: per key, the max rank seen in each touched register."""
+    reg = (hashes >> np.uint64(64 - HLL_P)).astype(np.int64)
+    rest = hashes << np.uint64(HLL_P)
+    hi, lo = rest >> np.uint64(32), rest & np.uint64(0xFFFFFFFF)
+    clz = np.where(hi > 0, 32 - _bit_length32(hi), np.where(lo > 0, 64 - _bit_length32(lo), 64))
+    rho = np.minimum(clz + 1, 64 - HLL_P + 1).astype(np.int8)
+    frame = keys.reset_index(drop=True).assign(reg=reg, rho=rho)
+    return frame.groupby(list(keys.columns) + ["reg"], sort=False, as_index=False)["rho"].max()
+
+
+def hll_estimate(regs: pd.DataFrame, by: list[str]) -> pd.Series:
+    """Distinct-count estimate per `by` group of a (merged) sparse sketch, with small-range correction."""
+    merged = regs.groupby(by + ["reg"], sort=False)["rho"].max()
+    inv = (2.0 ** -merged.astype(np.float64)).groupby(level=by).sum()
+    nnz = merged.groupby(level=by).size()
+    zeros = HLL_M - nnz
+    alpha = 0.7213 / (1 + 1.079 / HLL_M)
+    raw = alpha * HLL_M * HLL_M / (inv + zeros)
+    linear = HLL_M * np.log(HLL_M / zeros.where(zeros > 0, 1))
+    return raw.where((raw > 2.5 * HLL_M) | (zeros == 0), linear)
+
+
+@st.cache_data(show_spinner=False)
+def sketch_family(subset: pd.DataFrame, supplier_col: str, features: list[str]) -> dict:
+    """HLL registers over all rows + sampled top-k values, per (supplier, feature)."""
+    def _long(frame: pd.DataFrame) -> pd.DataFrame:
+        long = (
+            frame[[supplier_col] + features]
+            .astype(str)
+            .set_axis(["supplier"] + features, axis=1)
+            .melt(id_vars=["supplier"], var_name="feature", value_name="value")
+        )
+        long["supplier"] = long["supplier"].str.strip()
+        return long[long["value"] != ""]
+
+    long = _long(subset)
+    regs = _hll_registers(long[["supplier", "feature"]], pd.util.hash_array(long["value"].to_numpy(dtype=object)))
+
+    sample = subset.sample(n=APPROX_SAMPLE_ROWS, random_state=0) if len(subset) > APPROX_SAMPLE_ROWS else subset
+    counts = _long(sample).value_counts(["supplier", "feature", "value"]).rename("n").reset_index()
+    top = counts.groupby(["supplier", "feature"], sort=False).head(APPROX_TOP_K)
+
+    return {"regs": regs, "top": top, "sample_rows": len(sample), "rows": len(subset)}
+
+
+def sketch_aggregate(sketch: dict, group_col: str, supplier_col: str, features: list[str], group: str) -> pd.DataFrame:
+    """aggregate_data-shaped frame from a sketch: top values per cell, plus '+≈N more' when the HLL count says so."""
+    est = hll_estimate(sketch["regs"], ["supplier", "feature"]).round().astype(int)
+    top = sketch["top"].sort_values(["supplier", "feature", "value"])
+    shown = top.groupby(["supplier", "feature"], sort=False)["value"].agg(list)
+
+    cells = {}
+    for key, n in est.items():
+        vals = shown.get(key, [])
+        more = n - len(vals)
+        cells[key] = ", ".join(vals) + (f" (+≈{more} more)" if more > 0 else "")
+
+    suppliers = sorted(est.index.get_level_values(0).unique())
+    agg = pd.DataFrame({group_col: group, supplier_col: suppliers})
+    for f in features:
+        agg[f] = [cells.get((sup, f), "") for sup in suppliers]
+    return agg
+
+
+def sketch_feature_distinct(sketch: dict, suppliers: list[str], features: list[str]) -> list[int]:
+    """Per-feature distinct counts across `suppliers`, by merging their sketches (no raw rows involved)."""
+    regs = sketch["regs"]
+    est = hll_estimate(regs[regs["supplier"].isin(suppliers)], ["feature"]).round().astype(int)
+    return [int(est.get(f, 0)) for f in features]
+
+
+def _value_fingerprints(df: pd.DataFrame, group_col: str, supplier_col: str, features: list[str]) -> pd.DataFrame:
+    """Distinct non-empty (family, supplier, feature, value) tuples, each value fingerprinted as a uint64 hash."""
+    cols = [c for c in features if c in df.columns]
+    long = (
+        df[[group_col, supplier_col] + cols]
+        .astype(str)
+        .set_axis(["family", "supplier"] + cols, axis=1)
+        .melt(id_vars=["family", "supplier"], var_name="feature", value_name="value")
+    )
+    long["value"] = long["value"].str.strip()
+    long = long[long["value"] != ""]
+    long["h"] = pd.util.hash_array(long["value"].to_numpy(dtype=object))
+    return long.drop_duplicates(["family", "supplier", "feature", "h"], ignore_index=True)
+
+
+@st.cache_data(show_spinner=False)
+def diff_datasets(
+    old_df: pd.DataFrame,
+    new_df: pd.DataFrame,
+    group_col: str,
+    supplier_col: str,
+    features: list[str]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Compares two versions of a dataset in roughly linear time (hash joins only, no pairwise scans).
+    Returns (per-family summary, per-cell changes). A cell is one (family, supplier, feature) value set,
+    the same unit aggregate_data produces; Before/After use the same ", "-joined format.
+    """
+    keys = ["family", "supplier", "feature"]
+
+    # ---- Row-level: multiset difference of full-row fingerprints, per family ----
+    row_cols = [group_col, supplier_col] + [c for c in features if c in old_df.columns and c in new_df.columns]
+
+    def _row_counts(df: pd.DataFrame) -> pd.Series:
+        h = pd.util.hash_pandas_object(df[row_cols].astype(str), index=False)
+        return pd.Series(1, index=pd.MultiIndex.from_arrays([df[group_col].astype(str), h], names=["family", "h"])) \
+            .groupby(level=[0, 1]).sum()
+
+    rc = pd.concat([_row_counts(old_df), _row_counts(new_df)], axis=1, keys=["old", "new"]).fillna(0)
+    delta = rc["new"] - rc["old"]
+    rows = pd.DataFrame({
+        "Rows before": rc["old"],
+        "Rows after": rc["new"],
+        "Rows added": delta.clip(lower=0),
+        "Rows removed": (-delta).clip(lower=0),
+    }).groupby(level="family").sum().astype(int)
+
+    # ---- Cell-level: outer hash join of value fingerprints ----
+    old_long = _value_fingerprints(old_df, group_col, supplier_col, features)
+    new_long = _value_fingerprints(new_df, group_col, supplier_col, features)
+    m = old_long.merge(new_long, on=keys + ["h"], how="outer", indicator=True, suffixes=("_old", "_new"))
+
+    touched = m.loc[m["_merge"] != "both", keys].drop_duplicates()
+    m = m.merge(touched, on=keys, how="inner")
+    before = m[m["_merge"] != "right_only"].groupby(keys)["value_old"].agg(lambda x: ", ".join(sorted(set(x))))
+    after = m[m["_merge"] != "left_only"].groupby(keys)["value_new"].agg(lambda x: ", ".join(sorted(set(x))))
+
+    changes = touched.set_index(keys)
+    changes["Before"] = before.reindex(changes.index).fillna("")
+    changes["After"] = after.reindex(changes.index).fillna("")
+    changes["Status"] = np.select(
+        [changes["Before"] == "", changes["After"] == ""],
+        ["added", "removed"],
+        default="changed",
+    )
+    changes = changes.reset_index().sort_values(keys, ignore_index=True)
+
+    cells = changes.groupby(["family", "Status"]).size().unstack(fill_value=0)
+    cells = cells.reindex(columns=["added", "removed", "changed"], fill_value=0)
+    cells.columns = ["Cells added", "Cells removed", "Cells changed"]
+
+    summary = rows.join(cells, how="outer").fillna(0).astype(int)
+    summary.index.name = "Family"
+    summary = summary.reset_index()
+    summary = summary[(summary.drop(columns=["Family", "Rows before", "Rows after"]) > 0).any(axis=1)]
+    return summary.reset_index(drop=True), changes
+
+
+# ------------------------------------------
+# Supplier name resolution
+# ------------------------------------------
+# "TI", "Texas Instruments" and "Texas Instruments Inc." are resolved in three vectorized steps:
+#   1) blocking: every name gets keys (normalized form, acronym, tokens, 4-char prefix); only names sharing a
+#      key become candidate pairs, and oversized blocks are skipped, so pair count stays near-linear;
+#   2) similarity: character-trigram Jaccard for all candidate pairs at once via joins (plus exact rules for
+#      equal normalized forms and acronym ↔ full name);
+#   3) clustering: connected components by vectorized label propagation, one canonical name per cluster.
+# Accepted suggestions are saved to SUPPLIER_ALIASES_PATH and applied by load_data on every later upload.
+SUPPLIER_ALIASES_PATH = Path(__file__).with_name("supplier_aliases.json")
+_CORP_SUFFIXES = (
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "llc", "plc",
+    "gmbh", "ag", "sa", "nv", "bv", "srl", "spa", "kk", "oy", "ab", "the",
+)
+_MAX_BLOCK = 50
+
+
+def load_supplier_aliases() -> dict:
+    try:
+        return json.loads(SUPPLIER_ALIASES_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_supplier_aliases(aliases: dict) -> None:
+    SUPPLIER_ALIASES_PATH.write_text(json.dumps(aliases, indent=2, sort_keys=True, ensure_ascii=False), encoding="utf-8")
+
+
+def _normalize_supplier_names(names: pd.Series) -> pd.Series:
+    suffixes = r"\b(?:" + "|".join(_CORP_SUFFIXES) + r")\b"
+    return (
+        names.str.lower()
+        .str.replace(r"[^0-9a-z]+", " ", regex=True)
+        .str.replace(suffixes, " ", regex=True)
+        .str.split().str.join(" ")
+    )
+
+
+def _trigram_jaccard(norm: pd.Series, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Trigram Jaccard for every (a[i], b[i]) pair, computed with two joins instead of a Python loop."""
+    grams = (
+        ("  " + norm + " ").map(lambda t: [t[i:i + 3] for i in range(len(t) - 2)])
+        .explode().dropna()
+        .rename("g").rename_axis("id").reset_index()
+        .drop_duplicates()
+    )
+    size = grams.groupby("id").size()
+    pairs = pd.DataFrame({"a": a, "b": b})
+    shared = (
+        pairs.merge(grams.rename(columns={"id": "a"}), on="a")
+        .merge(grams.rename(columns={"id": "b"}), on=["b", "g"])
+        .groupby(["a", "b"]).size()
+    )
+    inter = shared.reindex(pd.MultiIndex.from_arrays([a, b])).fillna(0).to_numpy()
+    union = size.reindex(a).to_numpy() + size.reindex(b).to_numpy() - inter
+    return np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+
+
+def _connected_components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    labels = np.arange(n)
+    while True:
+        m = np.minimum(labels[a], labels[b])
+        new = labels.copy()
+        np.minimum.at(new, a, m)
+        np.minimum.at(new, b, m)
+        new = new[new]  # pointer jumping
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+@st.cache_data(show_spinner=False)
+def resolve_supplier_names(records: pd.Series, threshold: float = 0.75) -> pd.DataFrame:
+    """
+    Suggests alias → canonical supplier names. `records` maps each distinct supplier name to its row count.
+    Returns one row per non-canonical name: Alias, Canonical, Similarity, Records.
+    """
+    names = pd.Series(records.index.astype(str), name="name")
+    names = names[names.str.strip() != ""].reset_index(drop=True)
+    counts = records.reindex(names).to_numpy()
+    norm = _normalize_supplier_names(names)
+    tokens = norm.str.split()
+    acronym = norm.str.findall(r"\b[0-9a-z]").str.join("")
+    multi = tokens.str.len() >= 2
+
+    # 1) Blocking keys
+    keys = pd.concat([
+        "n:" + norm,
+        ("a:" + acronym)[multi],
+        ("a:" + norm)[~multi & (norm.str.len() <= 5)],
+        ("a:" + norm.str[:-1])[~multi & norm.str.len().between(3, 5)],  # "adi" meets acronym "ad"
+        ("p:" + norm.str[:4])[norm.str.len() >= 4],
+        "t:" + tokens.explode()[lambda t: t.str.len() >= 3],
+    ]).rename("key").rename_axis("id").reset_index().drop_duplicates()
+    keys = keys[keys["key"].str.len() > 2]  # names that normalize to nothing ("Inc.") never block together
+    keys = keys[keys.groupby("key")["id"].transform("size").between(2, _MAX_BLOCK)]
+    pairs = keys.merge(keys, on="key", suffixes=("_a", "_b"))
+    pairs = pairs.loc[pairs["id_a"] < pairs["id_b"], ["id_a", "id_b"]].drop_duplicates()
+    a, b = pairs["id_a"].to_numpy(), pairs["id_b"].to_numpy()
+
+    # 2) Similarity
+    sim = _trigram_jaccard(norm, a, b) if len(a) else np.zeros(0)
+    norm_v, acr_v, multi_v = norm.to_numpy(dtype=str), acronym.to_numpy(dtype=str), multi.to_numpy()
+    first_v = tokens.str[0].fillna("").to_numpy(dtype=str)
+
+    def _short_names_long(s_: np.ndarray, l_: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(acronym hit, first-token hit) where s_ is a single-token name and l_ a multi-token one."""
+        short = ~multi_v[s_] & multi_v[l_]
+        ns, al = norm_v[s_], acr_v[l_]
+        acr = short & ((ns == al) | ((np.char.str_len(ns) == np.char.str_len(al) + 1) & np.char.startswith(ns, al)))
+        return acr, short & (ns == first_v[l_])
+
+    acr_ab, first_ab = _short_names_long(a, b)
+    acr_ba, first_ba = _short_names_long(b, a)
+    sim = np.where(acr_ab | acr_ba, np.maximum(sim, 0.9), sim)
+    sim = np.where(first_ab | first_ba, np.maximum(sim, 0.85), sim)
+    sim = np.where(norm_v[a] == norm_v[b], 1.0, sim)
+    keep = sim >= threshold
+    a, b, sim = a[keep], b[keep], sim[keep]
+
+    # 3) Clusters + canonical name: prefer full names over acronyms, then most records, then longest
+    labels = _connected_components(len(names), a, b)
+    frame = pd.DataFrame({
+        "name": names, "cluster": labels, "records": counts,
+        "full": multi_v | (norm.str.len() > 5).to_numpy(), "len": names.str.len(),
+    })
+    canon = frame.sort_values(["full", "records", "len"], ascending=False).drop_duplicates("cluster").set_index("cluster")["name"]
+    best = pd.concat([pd.Series(sim, index=a), pd.Series(sim, index=b)]).groupby(level=0).max()
+
+    frame["Canonical"] = canon.reindex(labels).to_numpy()
+    frame["Similarity"] = best.reindex(frame.index).fillna(0).round(2)
+    out = frame[frame["name"] != frame["Canonical"]]
+    return (
+        out.rename(columns={"name": "Alias", "records": "Records"})[["Alias", "Canonical", "Similarity", "Records"]]
+        .sort_values(["Canonical", "Records"], ascending=[True, False], ignore_index=True)
+    )
+
+
+# ------------------------------------------
+# Global value search (inverted index)
+# ------------------------------------------
+# Postings are the distinct (family, supplier, feature, value) tuples of the whole dataset. Each normalized
+# token points at its postings in CSR layout over a sorted vocabulary, so a prefix lookup is one bisect plus
+# one contiguous slice, and ranking is a bincount over the hit ids.
+_TOKEN_RE = re.compile(r"[0-9a-z][0-9a-z\-_./+]*")
+
+
+def _tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def build_value_index(df: pd.DataFrame, group_col: str, supplier_col: str, features: list[str]) -> dict:
+    postings = _value_fingerprints(df, group_col, supplier_col, features).drop(columns="h")
+    tokens = postings["value"].str.lower().str.findall(_TOKEN_RE.pattern).explode().dropna()
+    pairs = pd.DataFrame({"token": tokens.to_numpy(), "pid": tokens.index.to_numpy()}).drop_duplicates()
+
+    codes, vocab = pd.factorize(pairs["token"], sort=True)
+    order = np.argsort(codes, kind="stable")
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(vocab)), out=offsets[1:])
+
+    return {
+        "postings": postings,
+        "norm_values": postings["value"].str.lower().to_numpy(),
+        "vocab": vocab.tolist(),
+        "offsets": offsets,
+        "ids": pairs["pid"].to_numpy()[order],
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def value_index_job(dataset_key: str, group_col: str, supplier_col: str, features: list[str], _load) -> dict:
+    """
+    Builds the value index once per dataset + mapping in a background thread. `_load` returns the frame;
+    it is not hashed, `dataset_key` identifies it. Poll `job["done"]` before reading `job["index"]`.
+    """
+    job = {"done": threading.Event(), "index": None, "error": None}
+
+    def _run():
+        try:
+            job["index"] = build_value_index(_load(), group_col, supplier_col, features)
+        except Exception as exc:
+            job["error"] = exc
+        finally:
+            job["done"].set()
+
+    threading.Thread(target=_run, name=f"value-index-{dataset_key}", daemon=True).start()
+    return job
+
+
+def search_value_index(index: dict, query: str, *, limit: int = 50) -> pd.DataFrame:
+    """
+    Ranked hits for a free-text query. Every query token is matched as a prefix; postings matching all tokens
+    rank first (falling back to any-token hits), then exact-token matches, then whole-value matches.
+    """
+    q_tokens = _tokenize(query)
+    postings = index["postings"]
+    if not q_tokens or postings.empty:
+        return postings.head(0).assign(Score=pd.Series(dtype=float))
+
+    vocab, offsets, ids = index["vocab"], index["offsets"], index["ids"]
+    n = len(postings)
+    matched = np.zeros(n, dtype=np.int64)
+    score = np.zeros(n, dtype=np.float64)
+    for t in q_tokens:
+        lo = bisect_left(vocab, t)
+        hi = bisect_left(vocab, t + "\uffff", lo)
+        if lo == hi:
+            continue
+        hit = np.unique(ids[offsets[lo]:offsets[hi]])
+        matched[hit] += 1
+        if vocab[lo] == t:
+            exact = ids[offsets[lo]:offsets[lo + 1]]
+            score[exact] += 0.5
+
+    need = len(q_tokens) if (matched == len(q_tokens)).any() else 1
+    cand = np.flatnonzero(matched >= need)
+    score[cand] += matched[cand]
+    score[cand] += index["norm_values"][cand] == " ".join(q_tokens)
+
+    top = cand[np.argsort(-score[cand], kind="stable")[:limit]]
+    return postings.iloc[top].assign(Score=score[top]).reset_index(drop=True)
+
+
+# ------------------------------------------
+# Cross-family supplier index
+# ------------------------------------------
+# One pass over the whole dataset aggregates every (supplier, family) pair at once. Rows are sorted supplier-major
+# (CSR layout: `offsets` brackets each supplier's families), so opening a supplier is one slice, however many
+# families there are. Dedupe + sort run on packed integer keys; only the final ", " joins touch strings.
+@st.cache_resource(show_spinner=False)
+def build_supplier_index(dataset_key: str, group_col: str, supplier_col: str, features: list[str], _load) -> dict:
+    """
+    Cells match aggregate_data (sorted distinct values, ", "-joined) for every (supplier, family) pair.
+    Cached per dataset_key (the frame behind `_load` is not hashed) and shared read-only across sessions.
+    """
+    frame = _load()[[supplier_col, group_col] + features].astype(str)
+    sup = frame[supplier_col].str.strip()
+    frame = frame[(sup != "").to_numpy()]
+    s_codes, suppliers = pd.factorize(sup[sup != ""], sort=True)
+    f_codes, families = pd.factorize(frame[group_col], sort=True)
+
+    # One row per (supplier, family) pair, in supplier-major order.
+    pair_ids, pair_of_row, records = np.unique(
+        s_codes.astype(np.int64) * len(families) + f_codes, return_inverse=True, return_counts=True
+    )
+    offsets = np.searchsorted(pair_ids // len(families), np.arange(len(suppliers) + 1))
+
+    # Long form (row pair, feature, value code) without melt; code order == string order.
+    n_feat = len(features)
+    raw = frame[features].to_numpy().ravel(order="F")
+    keep = raw != ""
+    v_codes, values = pd.factorize(raw[keep], sort=True)
+    cell = (np.tile(pair_of_row.astype(np.int64) * n_feat, n_feat) + np.repeat(np.arange(n_feat), len(frame)))[keep]
+    keys = np.sort(cell * len(values) + v_codes)
+    keys = keys[np.diff(keys, prepend=-1) != 0]  # sort + neighbour mask: much cheaper than np.unique here
+    cell, v_codes = keys // len(values), keys % len(values)
+
+    starts = np.flatnonzero(np.diff(cell, prepend=-1))
+    flat_values = values[v_codes].tolist()
+    bounds = np.r_[starts, len(cell)].tolist()
+    joined = [", ".join(flat_values[i:j]) for i, j in zip(bounds[:-1], bounds[1:])]
+
+    cells = np.full(len(pair_ids) * n_feat, "", dtype=object)
+    cells[cell[starts]] = joined
+    return {
+        "suppliers": suppliers.tolist(),
+        "position": {s: i for i, s in enumerate(suppliers)},
+        "families": np.asarray(families, dtype=object),
+        "features": list(features),
+        "offsets": offsets,
+        "family_codes": pair_ids % len(families),
+        "cells": cells.reshape(len(pair_ids), n_feat),
+        "records": records,
+    }
 
 
+def supplier_across_families(index: dict, supplier: str) -> tuple[pd.DataFrame, pd.Series]:
+    """(families × features cells, records per family) for one supplier: a slice of the CSR rows."""
+    i = index["position"][supplier]
+    lo, hi = index["offsets"][i], index["offsets"][i + 1]
+    families = index["families"][index["family_codes"][lo:hi]]
+    cells = pd.DataFrame(index["cells"][lo:hi], index=families, columns=index["features"])
+    return cells, pd.Series(index["records"][lo:hi], index=families)
+
 
 def _esc(x) -> str:
     return html.escape("" if x is None else str(x))
@@ -357,80 +1271,36 @@ def _shorten(s: str, limit: int = 120) -> str:
     return s[: max(0, limit - 1)] + "…"
 
 
-def build_compare_html(
-    data_by_supplier: dict,
-    suppliers: list[str],
-    features: list[str],
-    *,
-    show_only_differences: bool,
-    hide_empty_rows: bool,
-    strong_diff_threshold: int = 2
-) -> tuple[str, pd.DataFrame]:
+def build_version_diff_html(changes: pd.DataFrame, *, limit: int = 500) -> str:
     """
-    Returns HTML for a sticky "spec compare" table + the underlying compare dataframe.
+    Returns HTML (same sticky spec-table styling as the old compare table) for per-cell version changes.
+    Added values use the light diff style, changed values the strong one; only the first `limit` rows are rendered.
     """
-    # Create compare df for export as well
-    compare_df = pd.DataFrame({"Feature": features})
-    for sup in suppliers:
-        compare_df[sup] = [data_by_supplier.get(sup, {}).get(f, "") for f in features]
-
-    # Decide diff rows
-    diff_flags = []
-    for f in features:
-        row_vals = []
-        for sup in suppliers:
-            v = str(data_by_supplier.get(sup, {}).get(f, "")).strip()
-            if v != "":
-                row_vals.append(v)
-        distinct = len(set(row_vals))
-        is_diff = distinct >= 2
-        diff_flags.append((is_diff, distinct))
-
-    # Build HTML
     thead = "<thead><tr>"
-    thead += "<th><span class='spec-chip'>Feature</span></th>"
-    for sup in suppliers:
-        thead += f"<th><span class='spec-chip'>{_esc(sup)}</span></th>"
+    for h in ["Supplier", "Feature", "Status", "Before", "After"]:
+        thead += f"<th><span class='spec-chip'>{h}</span></th>"
     thead += "</tr></thead>"
 
-    rows_html = []
-    for i, f in enumerate(features):
-        is_diff, distinct = diff_flags[i]
-
-        if show_only_differences and not is_diff:
-            continue
-
-        # Hide row if all empty
-        if hide_empty_rows:
-            all_empty = True
-            for sup in suppliers:
-                if str(data_by_supplier.get(sup, {}).get(f, "")).strip() != "":
-                    all_empty = False
-                    break
-            if all_empty:
-                continue
+    def _cell(raw: str, cls: str) -> str:
+        if raw == "":
+            return "<td><div class='cell empty'>—</div></td>"
+        return f"<td><div class='{cls}' title='{_esc(raw)}'>{_esc(_shorten(raw, 150))}</div></td>"
 
+    rows_html = []
+    for rec in changes.head(limit).itertuples(index=False):
+        cls = "cell diff strong" if rec.Status == "changed" else "cell diff"
         tr = "<tr>"
-        tr += f"<td><div class='cell'><strong>{_esc(f)}</strong></div></td>"
-
-        for sup in suppliers:
-            raw = str(data_by_supplier.get(sup, {}).get(f, "")).strip()
-            if raw == "":
-                tr += "<td><div class='cell empty'>—</div></td>"
-            else:
-                cls = "cell"
-                if is_diff:
-                    cls += " diff"
-                    if distinct >= strong_diff_threshold:
-                        cls += " strong"
-                shown = _shorten(raw, 150)
-                tr += f"<td><div class='{cls}' title='{_esc(raw)}'>{_esc(shown)}</div></td>"
+        tr += f"<td><div class='cell'><strong>{_esc(rec.supplier)}</strong></div></td>"
+        tr += f"<td><div class='cell'>{_esc(rec.feature)}</div></td>"
+        tr += f"<td><span class='spec-chip'>{_esc(rec.Status)}</span></td>"
+        tr += _cell(rec.Before, "cell" if rec.Status == "added" else cls)
+        tr += _cell(rec.After, cls)
         tr += "</tr>"
         rows_html.append(tr)
 
     tbody = "<tbody>" + "".join(rows_html) + "</tbody>"
 
-    html_table = f"""
+    return f"""
     <div class="spec-wrap">
       <div class="spec-scroll">
         <table class="spec-table">
@@ -440,91 +1310,74 @@ def build_compare_html(
       </div>
     </div>
     """
-    return html_table, compare_df
 
 
+UI_HTML_PATH = Path(__file__).with_name("ui.html")
+
+
+@st.cache_resource(show_spinner=False)
+def load_ui_template() -> str:
+    return UI_HTML_PATH.read_text(encoding="utf-8")
 
 
-def build_catalog_html(
+def build_grid_payload(
     data_by_supplier: dict,
     suppliers: list[str],
     features: list[str],
     *,
-    hide_empty_columns: bool,
-    show_only_diff_columns: bool,
-    strong_diff_threshold: int = 2
-) -> tuple[str, pd.DataFrame]:
-    """Supplier Catalog as a wide, website-like table.
-    Rows = suppliers, Columns = features (same structure as input headers).
+    mode: str,
+    only_diff: bool = False,
+    hide_empty: bool = False,
+    search_rows: str = "",
+    search_cols: str = "",
+    feature_distinct: list[int] | None = None,
+    strong_diff_threshold: int = 2,
+    row_label: str | None = None,
+    height: int = 560
+) -> dict:
     """
-    # Base df for downloads
-    catalog_df = pd.DataFrame({"Supplier": suppliers})
-    for f in features:
-        catalog_df[f] = [data_by_supplier.get(s, {}).get(f, "") for s in suppliers]
+    Dictionary-encoded, columnar payload for the ui.html grid.
+    Every distinct cell value is sent once in `values`; `codes` holds one int array per feature (0 = empty).
+    `feature_distinct` (approximate mode) fixes the per-feature distinct counts used for diff flags;
+    otherwise the grid counts distinct cell codes itself. `row_label` renames the supplier axis (e.g. "Family"
+    when the rows of a catalog-mode grid are families).
+    """
+    grid = (
+        pd.DataFrame({s: data_by_supplier.get(s, {}) for s in suppliers}, columns=suppliers)
+        .reindex(index=features)
+        .fillna("")
+        .astype(str)
+    )
+    flat = np.concatenate([[""], np.char.strip(grid.to_numpy(dtype=str).ravel())])
+    codes, uniques = pd.factorize(flat)  # "" is seen first, so it always gets code 0
+
+    return {
+        "mode": mode,
+        "suppliers": [str(s) for s in suppliers],
+        "features": [str(f) for f in features],
+        "values": uniques.tolist(),
+        "codes": codes[1:].reshape(len(features), len(suppliers)).tolist(),
+        "distinct": feature_distinct,
+        "strong": strong_diff_threshold,
+        "row_label": row_label,
+        "options": {
+            "only_diff": only_diff,
+            "hide_empty": hide_empty,
+            "q_rows": search_rows,
+            "q_cols": search_cols,
+            "height": height,
+        },
+    }
 
-    # Column stats for filtering + styling
-    col_flags = {}
-    for f in features:
-        vals = []
-        any_non_empty = False
-        for s in suppliers:
-            v = str(data_by_supplier.get(s, {}).get(f, "")).strip()
-            if v != "":
-                any_non_empty = True
-                vals.append(v)
-        distinct = len(set(vals))
-        is_diff = distinct >= 2
-        col_flags[f] = {"any": any_non_empty, "diff": is_diff, "distinct": distinct}
-
-    visible_features = list(features)
-    if hide_empty_columns:
-        visible_features = [f for f in visible_features if col_flags.get(f, {}).get("any", False)]
-    if show_only_diff_columns:
-        visible_features = [f for f in visible_features if col_flags.get(f, {}).get("diff", False)]
-
-    # HTML header
-    thead = "<thead><tr>"
-    thead += "<th><span class='spec-chip'>Supplier</span></th>"
-    for f in visible_features:
-        thead += f"<th><span class='spec-chip'>{_esc(f)}</span></th>"
-    thead += "</tr></thead>"
 
-    # HTML body
-    rows_html = []
-    for s in suppliers:
-        tr = "<tr>"
-        tr += f"<td><div class='cell'><strong>{_esc(s)}</strong></div></td>"
-        for f in visible_features:
-            raw = str(data_by_supplier.get(s, {}).get(f, "")).strip()
-            if raw == "":
-                tr += "<td><div class='cell empty'>—</div></td>"
-            else:
-                cls = "cell"
-                if col_flags.get(f, {}).get("diff", False):
-                    cls += " diff"
-                    if col_flags.get(f, {}).get("distinct", 0) >= strong_diff_threshold:
-                        cls += " strong"
-                shown = _shorten(raw, 120)
-                tr += f"<td><div class='{cls}' title='{_esc(raw)}'>{_esc(shown)}</div></td>"
-        tr += "</tr>"
-        rows_html.append(tr)
+def render_grid(payload: dict) -> None:
+    """Renders the virtualized grid; filtering and scrolling then happen client-side with no rerun."""
+    # "</" must not appear inside the inline <script>
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    page = load_ui_template().replace("/*__PAYLOAD__*/null", data)
+    components.html(page, height=payload["options"]["height"] + 70, scrolling=False)
 
-    tbody = "<tbody>" + "".join(rows_html) + "</tbody>"
 
-    html_table = f"""
-    <div class=\"spec-wrap\">
-      <div class=\"spec-scroll\">
-        <table class=\"spec-table\">
-          {thead}
-          {tbody}
-        </table>
-      </div>
-    </div>
-    """
-
-    # Return df with only visible features for the view (downloads can use this or full)
-    view_df = catalog_df[["Supplier"] + visible_features] if visible_features else catalog_df[["Supplier"]]
-    return html_table, view_df
 def build_supplier_cards_html(
     suppliers_ordered: list[str],
     supplier_summary: dict,
@@ -576,15 +1429,35 @@ with st.sidebar:
     st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
     st.header("📂 Data Import")
     uploaded_file = st.file_uploader("Upload Excel/CSV", type=["xlsx", "csv", "xls"])
+    previous_file = st.file_uploader(
+        "Previous version (optional)",
+        type=["xlsx", "csv", "xls"],
+        help="Upload the earlier version of the same workbook to see what changed per family and supplier."
+    )
     st.markdown("</div>", unsafe_allow_html=True)
 
     st.divider()
 
+    use_store = st.toggle(
+        "Local SQLite store",
+        value=False,
+        help="Keep the dataset in an indexed on-disk store instead of memory. "
+             "Serves catalogs larger than RAM and skips re-parsing after a restart."
+    )
+
     if uploaded_file:
+        supplier_aliases = load_supplier_aliases()
         with st.spinner("Loading dataset…"):
-            df = load_data(uploaded_file)
-
-        cols = list(df.columns)
+            if use_store:
+                store_path = open_dataset_store(uploaded_file, supplier_aliases)
+                df = None
+                cols = store_columns(store_path)
+            else:
+                store_path = None
+                df = load_data(uploaded_file, supplier_aliases)
+                cols = list(df.columns)
+            df_prev = load_data(previous_file, supplier_aliases) if previous_file else None
+            dataset_key = dataset_digest(uploaded_file, supplier_aliases)
 
         st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
         st.header("⚙️ Configuration")
@@ -600,7 +1473,13 @@ with st.sidebar:
         c_die = st.selectbox("Grouping Column (e.g. Die Family)", cols, index=idx_die)
         c_supplier = st.selectbox("Supplier Column", cols, index=idx_sup)
 
-        remaining_cols = [c for c in cols if c not in [c_die, c_supplier]]
+        with st.expander("Drill-down hierarchy (optional)", expanded=False):
+            st.caption("Group by several columns, top → bottom (e.g. Category → Die Family → Variant). "
+                       "Parent levels are rolled up from their children.")
+            hierarchy_levels = st.multiselect("Levels", [c for c in cols if c != c_supplier], default=[c_die])
+        use_hierarchy = len(hierarchy_levels) >= 2
+
+        remaining_cols = [c for c in cols if c not in [c_die, c_supplier] + hierarchy_levels]
 
         # Use ALL remaining columns as features (Compare + Catalog).
         c_features = list(remaining_cols)
@@ -610,6 +1489,57 @@ with st.sidebar:
             exclude_cols = st.multiselect("Exclude columns", remaining_cols, default=[])
             if exclude_cols:
                 c_features = [c for c in remaining_cols if c not in exclude_cols]
+
+        approx_threshold = st.number_input(
+            "Approximate above (rows per family)",
+            min_value=0,
+            value=500_000,
+            step=50_000,
+            help="Larger families use mergeable sketches (HyperLogLog distinct counts + sampled top values) "
+                 "instead of exact aggregation. 0 disables. In-memory, single-level grouping only."
+        )
+
+        with st.expander("Supplier name resolution", expanded=False):
+            st.caption("Finds spellings of the same supplier (e.g. TI / Texas Instruments Inc.). "
+                       "Accepted aliases are saved and merged on every upload.")
+            if st.button("Find duplicate supplier names"):
+                with st.spinner("Resolving supplier names…"):
+                    if store_path:
+                        name_counts = store_value_counts(store_path, c_supplier)
+                    else:
+                        name_counts = df[c_supplier].astype(str).str.strip().value_counts()
+                    st.session_state["supplier_suggestions"] = (
+                        dataset_key, c_supplier, resolve_supplier_names(name_counts)
+                    )
+
+            pending = st.session_state.get("supplier_suggestions")
+            if pending and pending[:2] == (dataset_key, c_supplier):
+                suggestions = pending[2]
+                if suggestions.empty:
+                    st.success("No duplicate supplier names found.")
+                else:
+                    edited = st.data_editor(
+                        suggestions.assign(Apply=True),
+                        hide_index=True,
+                        disabled=["Alias", "Similarity", "Records"],
+                        key="alias_editor",
+                    )
+                    if st.button("Apply & save alias map"):
+                        picked = edited[edited["Apply"]]
+                        aliases = load_supplier_aliases()
+                        aliases.setdefault(c_supplier, {}).update(dict(zip(picked["Alias"], picked["Canonical"])))
+                        save_supplier_aliases(aliases)
+                        st.session_state.pop("supplier_suggestions", None)
+                        st.rerun()
+
+            active_aliases = supplier_aliases.get(c_supplier, {})
+            if active_aliases:
+                st.caption(f"{len(active_aliases)} alias(es) applied to **{_esc(c_supplier)}** on load.")
+                if st.button("Clear alias map for this column"):
+                    aliases = load_supplier_aliases()
+                    aliases.pop(c_supplier, None)
+                    save_supplier_aliases(aliases)
+                    st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
     else:
         st.info("Awaiting file upload…")
@@ -638,7 +1568,14 @@ if not uploaded_file:
     )
     st.stop()
 
-base_rows, base_cols = df.shape
+# Whole-dataset frame for the background / cached builders (read back from SQLite in store mode).
+load_frame = partial(store_frame, store_path) if store_path else (lambda: df)
+
+if store_path:
+    ensure_store_indexes(store_path, c_die, c_supplier)
+    base_rows, base_cols = store_shape(store_path)
+else:
+    base_rows, base_cols = df.shape
 preview_rows = min(5, base_rows)
 
 with st.expander("Dataset overview", expanded=False):
@@ -663,23 +1600,142 @@ with st.expander("Dataset overview", expanded=False):
     with preview_col:
         st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
         st.caption("First few rows (sanity check)")
-        st.dataframe(df.head(preview_rows), use_container_width=True, height=240)
+        preview_df = store_frame(store_path, limit=preview_rows) if store_path else df.head(preview_rows)
+        st.dataframe(preview_df, use_container_width=True, height=240)
         st.markdown("</div>", unsafe_allow_html=True)
 
+    with st.spinner("Profiling columns…"):
+        profile_df, family_fill = profile_dataset(dataset_key, c_die, load_frame)
+
+    st.markdown("##### Column profile")
+    st.caption("Fill rate, distinct values, most common values and value lengths per column — useful for choosing mapping and exclusions.")
+    st.dataframe(
+        profile_df,
+        use_container_width=True,
+        hide_index=True,
+        height=320,
+        column_config={
+            "Fill %": st.column_config.ProgressColumn("Fill %", min_value=0, max_value=100, format="%.0f%%"),
+            "Len median": st.column_config.NumberColumn(format="%.0f"),
+            "Len p95": st.column_config.NumberColumn(format="%.0f"),
+        },
+    )
+
+    st.markdown(f"##### Fill rate by {_esc(c_die)}")
+    st.dataframe(
+        family_fill,
+        use_container_width=True,
+        height=280,
+        column_config={c: st.column_config.NumberColumn(format="%.0f%%") for c in family_fill.columns},
+    )
+
 if not c_features:
     st.error("Please select at least one feature from the sidebar.")
     st.stop()
 
-unique_groups = sorted(list(set(df[c_die].astype(str))))
+if store_path:
+    unique_groups = store_groups(store_path, c_die)
+else:
+    unique_groups = sorted(list(set(df[c_die].astype(str))))
 if not unique_groups:
     st.error("No data found in the selected grouping column.")
     st.stop()
 
+VIEW_COMPARE, VIEW_CATALOG, VIEW_SUPPLIER, VIEW_DIFF = (
+    "📊 Compare View", "📋 Catalog View", "🏭 Supplier View", "🔀 Version Diff"
+)
+
+
+def _jump_to_hit(family: str, supplier: str, feature: str, view: str, family_suppliers: list[str]):
+    """on_click callback: runs before the rerun, so it may still set the family/view widget state."""
+    st.session_state["selected_group"] = family
+    st.session_state["active_view"] = view
+    st.session_state["grid_focus"] = {"family": family, "supplier": supplier, "feature": feature}
+    if view == VIEW_COMPARE:
+        st.session_state["compare_suppliers"] = family_suppliers
+    st.session_state["search_jump"] = True
+
+
+@fragment
+def render_value_search(dataset_key: str, c_die: str, c_supplier: str, c_features: list[str], load_frame):
+    # Searching reruns only this panel; opening a hit escalates to a full rerun.
+    if st.session_state.pop("search_jump", False):
+        st.rerun()
+
+    job = value_index_job(dataset_key, c_die, c_supplier, c_features, load_frame)
+    value_q = st.text_input("Find a value in any family", value="", placeholder="e.g. SOT-23, QFN-16…")
+
+    if not job["done"].is_set():
+        st.info("Building the search index in the background… try again in a moment.")
+        return
+    if job["error"] is not None:
+        st.error(f"Search index failed to build: {job['error']}")
+        return
+    if not value_q.strip():
+        st.caption("Searches every cell value across all families, suppliers, and features.")
+        return
+
+    hits = search_value_index(job["index"], value_q)
+    if hits.empty:
+        st.info("No values match your search.")
+        return
+
+    st.dataframe(
+        hits.rename(columns={"family": "Family", "supplier": "Supplier", "feature": "Feature", "value": "Value"}),
+        use_container_width=True, hide_index=True, height=240
+    )
+    labels = [f"{h.family} · {h.supplier} · {h.feature}: {_shorten(h.value, 60)}" for h in hits.itertuples()]
+    pick = st.selectbox("Open hit", range(len(hits)), format_func=lambda i: labels[i])
+    hit = hits.iloc[pick]
+    same_cell = hits[(hits["family"] == hit["family"]) & (hits["feature"] == hit["feature"])]
+    family_suppliers = list(dict.fromkeys(same_cell["supplier"].astype(str).str.strip()))
+    args = (str(hit["family"]), str(hit["supplier"]).strip(), str(hit["feature"]))
+
+    b1, b2 = st.columns(2)
+    b1.button("Open in Compare View", on_click=_jump_to_hit, args=args + (VIEW_COMPARE, family_suppliers))
+    b2.button("Open in Catalog View", on_click=_jump_to_hit, args=args + (VIEW_CATALOG, family_suppliers))
+
+
+with st.expander("🔎 Search values across all families", expanded=False):
+    render_value_search(dataset_key, c_die, c_supplier, c_features, load_frame)
+
 st.divider()
 
+if use_hierarchy:
+    hierarchy = build_hierarchy(dataset_key, hierarchy_levels, c_supplier, c_features, load_frame)
+
+
+def _sync_drill_node(hierarchy: dict):
+    """Keeps the node in context when the drill level changes: expand → first child, collapse → ancestor."""
+    old = st.session_state.get("selected_group")
+    old_path = tuple(old.split(HIERARCHY_SEP)) if old else ()
+    depth = st.session_state["drill_depth"]
+    if len(old_path) >= depth:
+        new = old_path[:depth]
+    else:
+        children = [n for n in hierarchy_nodes(hierarchy, depth) if n[:len(old_path)] == old_path]
+        new = children[0] if children else None
+    if new:
+        st.session_state["selected_group"] = HIERARCHY_SEP.join(new)
+
+
 top_row = st.columns([1.6, 1], gap="large")
 with top_row[0]:
-    selected_group = st.selectbox("Select Component Family to Analyze:", unique_groups)
+    if use_hierarchy:
+        depth = st.select_slider(
+            "Drill level",
+            options=list(range(1, len(hierarchy_levels) + 1)),
+            format_func=lambda d: hierarchy_levels[d - 1],
+            key="drill_depth",
+            on_change=_sync_drill_node,
+            args=(hierarchy,),
+        )
+        group_nodes = hierarchy_nodes(hierarchy, depth)
+        unique_groups = [HIERARCHY_SEP.join(n) for n in group_nodes]
+
+    if st.session_state.get("selected_group") not in unique_groups:
+        st.session_state.pop("selected_group", None)
+    selected_group = st.selectbox("Select Component Family to Analyze:", unique_groups, key="selected_group")
 with top_row[1]:
     st.markdown(
         "<div class='card' style='padding: 12px 14px;'>"
@@ -689,7 +1745,32 @@ with top_row[1]:
         unsafe_allow_html=True
     )
 
-subset = df[df[c_die].astype(str) == selected_group]
+if use_hierarchy:
+    # Both the cells and the record counts come straight from the precomputed rollup.
+    selected_path = group_nodes[unique_groups.index(selected_group)]
+    agg_df, supplier_records = hierarchy_node_aggregate(hierarchy, selected_path, c_die, c_supplier, c_features)
+    kpis = kpis_from_records(supplier_records)
+    persisted = None
+else:
+    # A warm restart reads the family straight from the aggregate store; nothing below recomputes it.
+    agg_store_key = aggregate_store_key(dataset_key, c_die, c_supplier, c_features)
+    persisted = load_family_aggregate(agg_store_key, selected_group)
+    if persisted is not None:
+        agg_df, kpis, family_state = persisted
+    elif store_path:
+        kpis = store_family_kpis(store_path, c_die, c_supplier, selected_group)
+    else:
+        subset = df[df[c_die].astype(str) == selected_group]
+        kpis = family_kpis(subset, c_supplier)
+
+exact_groups = st.session_state.setdefault("exact_groups", set())
+use_approx = (
+    persisted is None and not use_hierarchy and not store_path and approx_threshold > 0
+    and kpis["total_records"] > approx_threshold and selected_group not in exact_groups
+)
+if use_approx:
+    with st.spinner("Sketching large family…"):
+        sketch = sketch_family(subset, c_supplier, c_features)
 
 # ---- KPIs ----
 st.markdown("<div class='card hover-lift' style='margin-top: 0.25rem;'>", unsafe_allow_html=True)
@@ -702,83 +1783,126 @@ with kpi_header[1]:
 
 kpi1, kpi2, kpi3, kpi4 = st.columns(4)
 
-num_suppliers = int(subset[c_supplier].nunique())
+num_suppliers = kpis["num_suppliers"]
 num_features = int(len(c_features))
-total_records = int(len(subset))
-
-if not subset.empty and subset[c_supplier].astype(str).ne("").any():
-    try:
-        top_supplier = subset[c_supplier].mode()[0]
-    except Exception:
-        top_supplier = "N/A"
-else:
-    top_supplier = "N/A"
+total_records = kpis["total_records"]
+top_supplier = kpis["top_supplier"]
 
 kpi1.metric("Active Suppliers", num_suppliers)
 kpi2.metric("Features Tracked", num_features)
 kpi3.metric("Total Records", total_records)
 kpi4.metric("Top Supplier", top_supplier)
 
+if use_approx:
+    approx_note = st.columns([3, 1])
+    with approx_note[0]:
+        st.caption(
+            f"≈ Approximate mode ({total_records:,} rows > {approx_threshold:,}): distinct counts and diff flags "
+            f"come from HyperLogLog sketches, ±{HLL_REL_ERROR * 100:.1f}% (1σ). Cells show the top "
+            f"{APPROX_TOP_K} values from a {sketch['sample_rows']:,}-row sample; frequencies ±"
+            f"{100 / np.sqrt(sketch['sample_rows']):.1f} pts. Record counts are exact."
+        )
+    with approx_note[1]:
+        if st.button("Compute exact"):
+            exact_groups.add(selected_group)
+            st.rerun()
+
 st.markdown("</div>", unsafe_allow_html=True)
 
 # ---- Data processing ----
-with st.spinner("Building comparison views…"):
-    agg_df = aggregate_data(subset, c_die, c_supplier, c_features)
+provenance = None  # cell → source rows; built by aggregate_data, otherwise on demand (see provenance_source)
+if not use_hierarchy and persisted is None:
+    with st.spinner("Building comparison views…"):
+        if store_path:
+            agg_df = store_aggregate(store_path, c_die, c_supplier, c_features, selected_group)
+        elif use_approx:
+            agg_df = sketch_aggregate(sketch, c_die, c_supplier, c_features, selected_group)
+        else:
+            agg_df, provenance = aggregate_data(subset, c_die, c_supplier, c_features)
 
 if agg_df.empty:
     st.warning("No data available for this selection.")
     st.stop()
 
 # =========================================================
-# Build website-like maps for Compare + Catalog
+# Build website-like maps for Compare + Catalog (shared, computed once)
 # =========================================================
-suppliers_all = sorted([s for s in agg_df[c_supplier].astype(str).unique().tolist() if str(s).strip() != ""])
-if not suppliers_all:
+if persisted is None:
+    family_state = build_family_state(agg_df, c_supplier, c_features, kpis["supplier_records"])
+    family_state["sketch"] = sketch if use_approx else None
+    if not use_hierarchy and not use_approx:
+        save_family_aggregate(agg_store_key, selected_group, agg_df, kpis, family_state)
+if not family_state["suppliers_all"]:
     st.warning("No suppliers found (empty supplier column for this selection).")
     st.stop()
 
-# Per-supplier feature values (already aggregated)
-supplier_feature_map = {}
-for _, row in agg_df.iterrows():
-    sup = str(row[c_supplier]).strip()
-    if sup == "":
-        continue
-    supplier_feature_map.setdefault(sup, {})
-    for f in c_features:
-        supplier_feature_map[sup][f] = str(row.get(f, "")).strip()
-
-# Supplier record counts (raw subset)
-supplier_records = subset.groupby(c_supplier).size().to_dict()
-
-# Coverage summary per supplier
-supplier_summary = {}
-for sup in suppliers_all:
-    filled = 0
-    for f in c_features:
-        if str(supplier_feature_map.get(sup, {}).get(f, "")).strip() != "":
-            filled += 1
-    total = len(c_features)
-    coverage_pct = (filled / total * 100.0) if total else 0.0
-    supplier_summary[sup] = {
-        "filled": filled,
-        "total": total,
-        "coverage_pct": coverage_pct,
-        "records": int(supplier_records.get(sup, 0)),
-    }
+# ---- Cell provenance ----
+# The family as ((column, value), ...): one pair for a flat family, one per level for a hierarchy node.
+family_scope = tuple(zip(hierarchy_levels[:depth], selected_path)) if use_hierarchy else ((c_die, selected_group),)
+
+
+def provenance_source():
+    """
+    (values, rows) lookups behind the source-rows panel, called only while the panel is open.
+    Store mode answers from SQLite; in memory the index from aggregate_data is reused when this run built it,
+    otherwise (persisted, approximate or hierarchy families) it is built once for the family and cached.
+    """
+    if store_path:
+        return (
+            partial(store_cell_values, store_path, c_supplier, family_scope),
+            partial(store_cell_rows, store_path, c_supplier, family_scope),
+        )
+    group_col, group = family_scope[-1]
+    prov = provenance
+    if prov is None:
+        mask = np.logical_and.reduce([df[c].astype(str).to_numpy() == v for c, v in family_scope])
+        with st.spinner("Indexing source rows…"):
+            prov = aggregate_data(df[mask], group_col, c_supplier, c_features)[1]
+    return partial(provenance_values, prov, group), partial(provenance_rows, prov, df, group)
+
 
 # ==========================================
-# 5) TABS: Website-like Compare + Catalog
+# 5) VIEWS: Website-like Compare + Catalog
 # ==========================================
-tab_matrix, tab_catalog = st.tabs(["📊 Compare View", "📋 Catalog View"])
+# Each view is a fragment: its own widgets rerun only that view, never the KPIs or family state above.
+# Only the selected view is built; switching views is a full rerun that reuses the cached aggregation.
+PROVENANCE_PAGE_ROWS = 25
+
+
+def render_provenance_panel(suppliers: list[str], features: list[str], load_source, key: str):
+    """Side panel: pick a grid cell (supplier × feature × value) and page through the rows it came from."""
+    st.markdown("##### 🔍 Source rows")
+    supplier = st.selectbox("Supplier", suppliers, key=f"{key}_supplier")
+    feature = st.selectbox("Feature", features, key=f"{key}_feature")
+    cell_values, cell_rows = load_source()
+    counts = cell_values(supplier, feature)
+    if not counts:
+        st.info("This cell is empty.")
+        return
+    value = st.selectbox(
+        "Value", list(counts), format_func=lambda v: f"{_shorten(v, 60)} ({counts[v]:,} rows)", key=f"{key}_value"
+    )
+    total = counts[value]
+    pages = max(1, -(-total // PROVENANCE_PAGE_ROWS))
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page") if pages > 1 else 1
+    offset = (page - 1) * PROVENANCE_PAGE_ROWS
+    st.dataframe(cell_rows(supplier, feature, value, offset, PROVENANCE_PAGE_ROWS), use_container_width=True)
+    st.caption(
+        f"Rows {offset + 1:,}–{min(offset + PROVENANCE_PAGE_ROWS, total):,} of {total:,} · "
+        "index = row position in the upload (0-based)."
+    )
+
+
+@fragment
+def render_compare_view(selected_group: str, family_state: dict, c_features: list[str], load_source):
+    suppliers_all = family_state["suppliers_all"]
+    supplier_feature_map = family_state["supplier_feature_map"]
+    supplier_summary = family_state["supplier_summary"]
 
-with tab_matrix:
     st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
     st.markdown("#### ⚔️ Supplier Comparison Builder")
     st.caption("Pick suppliers. The table uses **all features** (you can search features if needed).")
 
-    # Controls
-    ctl1, ctl2, ctl3 = st.columns([1.6, 1.4, 1], gap="large")
-
     # Default suppliers: top by records (or a selection pushed from Catalog view)
     top_by_records = sorted(suppliers_all, key=lambda s: supplier_summary.get(s, {}).get("records", 0), reverse=True)
     default_compare = top_by_records[:4] if len(top_by_records) >= 2 else top_by_records
@@ -787,48 +1911,46 @@ with tab_matrix:
         if len(pushed) >= 2:
             default_compare = pushed
 
-    with ctl1:
-        compare_suppliers = st.multiselect(
-            "Suppliers to compare",
-            suppliers_all,
-            default=default_compare,
-        )
-    with ctl2:
-        feature_q = st.text_input(
-            "Search features (optional)",
-            value="",
-            placeholder="Type part of a feature name…"
-        )
-    with ctl3:
-        show_only_diff = st.toggle("Only differences", value=False)
-        hide_empty_rows = st.toggle("Hide empty rows", value=True)
-
-    compare_features = list(c_features)
-    if feature_q.strip():
-        ql = feature_q.strip().lower()
-        compare_features = [f for f in c_features if ql in str(f).lower()]
+    # A value-search hit pre-filters the grid to its feature (one-shot).
+    focus = st.session_state.pop("grid_focus", None)
+    focus = focus if focus and focus["family"] == selected_group else {}
+
+    # Feature search, "only differences" and "hide empty rows" live inside the grid (client-side).
+    compare_suppliers = st.multiselect(
+        "Suppliers to compare",
+        suppliers_all,
+        default=default_compare,
+    )
+
     if len(compare_suppliers) < 2:
         st.info("Select at least **2 suppliers** to compare.")
         st.markdown("</div>", unsafe_allow_html=True)
-    elif len(compare_features) == 0:
-        st.info("No features match your search filter.")
-        st.markdown("</div>", unsafe_allow_html=True)
     else:
-        # Build compare HTML
-        html_table, compare_df = build_compare_html(
-            supplier_feature_map,
-            compare_suppliers,
-            compare_features,
-            show_only_differences=show_only_diff,
-            hide_empty_rows=hide_empty_rows,
-            strong_diff_threshold=2
-        )
+        compare_df = pd.DataFrame({"Feature": c_features})
+        for sup in compare_suppliers:
+            compare_df[sup] = [supplier_feature_map.get(sup, {}).get(f, "") for f in c_features]
 
         st.markdown(
             "<div class='note-muted'>Tip: hover cells to see full value (tooltip). Sticky header + first column stay visible.</div>",
             unsafe_allow_html=True
         )
-        st.markdown(html_table, unsafe_allow_html=True)
+        sketch = family_state.get("sketch")
+        show_rows = st.toggle("Show source rows panel", key="compare_provenance_open")
+        grid_col, side_col = st.columns([2.2, 1.3], gap="medium") if show_rows else (st.container(), None)
+        with grid_col:
+            render_grid(build_grid_payload(
+                supplier_feature_map,
+                compare_suppliers,
+                c_features,
+                mode="compare",
+                feature_distinct=sketch_feature_distinct(sketch, compare_suppliers, c_features) if sketch else None,
+                hide_empty=True,
+                search_rows=focus.get("feature", ""),
+                strong_diff_threshold=2
+            ))
+        if side_col is not None:
+            with side_col:
+                render_provenance_panel(compare_suppliers, c_features, load_source, key="compare_provenance")
 
         # Download compare data
         csv_bytes = compare_df.to_csv(index=False).encode("utf-8")
@@ -842,42 +1964,38 @@ with tab_matrix:
 
         st.markdown("</div>", unsafe_allow_html=True)
 
-with tab_catalog:
+
+@fragment
+def render_catalog_view(selected_group: str, family_state: dict, c_features: list[str], load_source):
+    suppliers_all = family_state["suppliers_all"]
+    supplier_feature_map = family_state["supplier_feature_map"]
+    supplier_summary = family_state["supplier_summary"]
+
     st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
     st.markdown("#### 🧾 Supplier Catalog (Table)")
     st.caption("Website-like catalog table: **rows = suppliers**, **columns = features** (same structure as your input headers).")
 
-    # Catalog controls
-    c1, c2, c3 = st.columns([1.6, 1.2, 1.2], gap="large")
+    # A value-search hit pre-filters the grid to its supplier + feature (one-shot).
+    focus = st.session_state.pop("grid_focus", None)
+    focus = focus if focus and focus["family"] == selected_group else {}
+
+    # Catalog controls (supplier/column search and column filters live inside the grid, client-side)
+    c1, c2 = st.columns([1.2, 1.2], gap="large")
     with c1:
-        q = st.text_input("Search supplier", value="", placeholder="Type a supplier name…")
-    with c2:
         sort_by = st.selectbox(
             "Sort suppliers",
             ["Coverage (desc)", "Records (desc)", "Name (A→Z)", "Name (Z→A)"],
             index=0
         )
-    with c3:
+    with c2:
         filter_feature = st.selectbox(
             "Supplier must have value for",
             ["(no filter)"] + list(c_features),
             index=0
         )
 
-    c4, c5, c6 = st.columns([1.6, 1, 1], gap="large")
-    with c4:
-        feature_q = st.text_input("Search columns (optional)", value="", placeholder="Type part of a feature/column name…")
-    with c5:
-        show_only_diff_cols = st.toggle("Only different columns", value=False)
-    with c6:
-        hide_empty_cols = st.toggle("Hide all-empty columns", value=False)
-
-    # Filter suppliers (search + optional feature filter)
+    # Filter suppliers (optional feature filter)
     filtered = suppliers_all
-    if q.strip():
-        ql = q.strip().lower()
-        filtered = [s for s in filtered if ql in s.lower()]
-
     if filter_feature != "(no filter)":
         f = filter_feature
         filtered = [
@@ -895,12 +2013,6 @@ with tab_catalog:
     else:
         filtered = sorted(filtered, key=lambda s: s.lower(), reverse=True)
 
-    # Filter visible columns (optional search)
-    visible_features = list(c_features)
-    if feature_q.strip():
-        qf = feature_q.strip().lower()
-        visible_features = [f for f in visible_features if qf in str(f).lower()]
-
     # Quick compare selector (pushes selection into Compare tab defaults)
     with st.expander("Quick compare (send suppliers to Compare View)", expanded=False):
         default_pick = filtered[:4] if len(filtered) >= 4 else filtered
@@ -915,33 +2027,159 @@ with tab_catalog:
     if not filtered:
         st.info("No suppliers match your filters.")
         st.markdown("</div>", unsafe_allow_html=True)
-    elif len(visible_features) == 0:
-        st.info("No columns match your column search filter.")
-        st.markdown("</div>", unsafe_allow_html=True)
     else:
-        # Build website-like catalog table
-        html_table, catalog_view_df = build_catalog_html(
-            supplier_feature_map,
-            filtered,
-            visible_features,
-            hide_empty_columns=hide_empty_cols,
-            show_only_diff_columns=show_only_diff_cols,
-            strong_diff_threshold=2
-        )
+        catalog_df = pd.DataFrame({"Supplier": filtered})
+        for f in c_features:
+            catalog_df[f] = [supplier_feature_map.get(s, {}).get(f, "") for s in filtered]
 
         st.markdown(
             "<div class='note-muted'>Tip: use horizontal scroll for many columns. Hover any cell to see the full value.</div>",
             unsafe_allow_html=True
         )
-        st.markdown(html_table, unsafe_allow_html=True)
-
-        # Download (current view)
-        csv_bytes = catalog_view_df.to_csv(index=False).encode("utf-8")
+        sketch = family_state.get("sketch")
+        show_rows = st.toggle("Show source rows panel", key="catalog_provenance_open")
+        grid_col, side_col = st.columns([2.2, 1.3], gap="medium") if show_rows else (st.container(), None)
+        with grid_col:
+            render_grid(build_grid_payload(
+                supplier_feature_map,
+                filtered,
+                c_features,
+                mode="catalog",
+                feature_distinct=sketch_feature_distinct(sketch, filtered, c_features) if sketch else None,
+                search_rows=focus.get("supplier", ""),
+                search_cols=focus.get("feature", ""),
+                strong_diff_threshold=2
+            ))
+        if side_col is not None:
+            with side_col:
+                render_provenance_panel(filtered, c_features, load_source, key="catalog_provenance")
+
+        # Download (all columns for the filtered suppliers)
+        csv_bytes = catalog_df.to_csv(index=False).encode("utf-8")
         st.download_button(
-            "Download catalog (CSV — current view)",
+            "Download catalog (CSV)",
             data=csv_bytes,
             file_name=f"catalog_{selected_group}.csv".replace(" ", "_"),
             mime="text/csv",
         )
 
         st.markdown("</div>", unsafe_allow_html=True)
+
+
+@fragment
+def render_supplier_view(
+    dataset_key: str, c_die: str, c_supplier: str, c_features: list[str], load_frame, default_supplier: str
+):
+    # Not tied to selected_group: switching the supplier reruns only this view and reads the prebuilt index.
+    st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
+    st.markdown("#### 🏭 One Supplier Across Families")
+    st.caption("**Rows = families**, **columns = features** for one supplier. Highlighted columns differ between families.")
+
+    with st.spinner("Indexing suppliers across all families…"):
+        index = build_supplier_index(dataset_key, c_die, c_supplier, c_features, load_frame)
+    suppliers = index["suppliers"]
+    if not suppliers:
+        st.info("No suppliers found in the dataset.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    if st.session_state.get("cross_family_supplier") not in suppliers:
+        st.session_state["cross_family_supplier"] = default_supplier if default_supplier in suppliers else suppliers[0]
+    supplier = st.selectbox("Supplier", suppliers, key="cross_family_supplier")
+    cells, records = supplier_across_families(index, supplier)
+    st.caption(f"{len(cells):,} families · {int(records.sum()):,} records")
+
+    render_grid(build_grid_payload(
+        cells.to_dict("index"),
+        cells.index.tolist(),
+        c_features,
+        mode="catalog",
+        row_label="Family",
+        strong_diff_threshold=2
+    ))
+
+    csv_bytes = cells.assign(Records=records).rename_axis(c_die).reset_index().to_csv(index=False).encode("utf-8")
+    st.download_button(
+        "Download supplier across families (CSV)",
+        data=csv_bytes,
+        file_name=f"supplier_{supplier}.csv".replace(" ", "_"),
+        mime="text/csv",
+    )
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
+@fragment
+def render_version_diff_view(
+    selected_group: str,
+    df_prev: pd.DataFrame,
+    df: pd.DataFrame,
+    c_die: str,
+    c_supplier: str,
+    c_features: list[str]
+):
+    st.markdown("<div class='card hover-lift'>", unsafe_allow_html=True)
+    st.markdown("#### 🔀 Compare Against Previous Version")
+    st.caption("Values added, removed, or changed per **family**, **supplier**, and **feature** between the two uploads.")
+
+    missing = [c for c in [c_die, c_supplier] if c not in df_prev.columns]
+    if missing:
+        st.error(f"The previous version has no column(s): {', '.join(missing)}. Check the column mapping.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    with st.spinner("Diffing versions…"):
+        summary, changes = diff_datasets(df_prev, df, c_die, c_supplier, c_features)
+
+    if summary.empty:
+        st.success("No differences found between the two versions.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    st.markdown("##### All families")
+    st.dataframe(summary, use_container_width=True, hide_index=True, height=240)
+
+    fam_changes = changes[changes["family"] == selected_group]
+    st.markdown(f"##### {_esc(selected_group)}")
+    if fam_changes.empty:
+        st.info("No value changes in this family.")
+    else:
+        status_pick = st.multiselect("Show", ["added", "removed", "changed"], default=["added", "removed", "changed"])
+        shown = fam_changes[fam_changes["Status"].isin(status_pick)]
+        limit = 500
+        if len(shown) > limit:
+            st.caption(f"Showing the first {limit} of {len(shown)} changes. Download the CSV for the full list.")
+        st.markdown(build_version_diff_html(shown, limit=limit), unsafe_allow_html=True)
+
+        csv_bytes = shown.to_csv(index=False).encode("utf-8")
+        st.download_button(
+            "Download changes (CSV)",
+            data=csv_bytes,
+            file_name=f"version_diff_{selected_group}.csv".replace(" ", "_"),
+            mime="text/csv",
+        )
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+view_options = [VIEW_COMPARE, VIEW_CATALOG, VIEW_SUPPLIER]
+if df_prev is not None:
+    view_options.append(VIEW_DIFF)
+
+active_view = st.radio(
+    "View",
+    view_options,
+    horizontal=True,
+    key="active_view",
+    label_visibility="collapsed",
+)
+
+if active_view == VIEW_COMPARE:
+    render_compare_view(selected_group, family_state, c_features, provenance_source)
+elif active_view == VIEW_CATALOG:
+    render_catalog_view(selected_group, family_state, c_features, provenance_source)
+elif active_view == VIEW_SUPPLIER:
+    render_supplier_view(dataset_key, c_die, c_supplier, c_features, load_frame, kpis["top_supplier"])
+else:
+    # The diff needs whole frames; in store mode the current version is read back from SQLite for it.
+    df_current = store_frame(store_path) if store_path else df
+    render_version_diff_view(selected_group, df_prev, df_current, c_die, c_supplier, c_features)